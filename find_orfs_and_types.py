@@ -1,14 +1,16 @@
 #! /usr/bin/env python
 
 import argparse
-from Bio import SeqIO
+import pyfaidx
 from plastid.genomics.roitools import Transcript, SegmentChain
-import re
 from collections import defaultdict
+from itertools import product
 import pandas as pd
 import numpy as np
+import numba
+import pyarrow as pa
+import pyarrow.parquet as pq
 import multiprocessing as mp
-import subprocess as sp
 import os
 import sys
 from time import strftime
@@ -17,10 +19,9 @@ parser = argparse.ArgumentParser(description='Identify all possible ORFs in a tr
 parser.add_argument('genomefasta', help='Path to genome FASTA-file')
 parser.add_argument('--tfamstem', default='tfams', help='Transcript family information generated by make_tfams.py. Both TFAMSTEM.txt and '
                                                         'TFAMSTEM.bed should exist. (Default: tfams)')
-parser.add_argument('--orfstore', default='orf.h5',
-                    help='File to which to output the final table of identified ORFs. Will be formatted as a pandas HDF store (table name is '
-                         '"all_orfs"). Different columns of the table indicate various of each ORF, such as start codon, length, etc. '
-                         '(Default: orf.h5)')
+parser.add_argument('--orfstore', default='orf.parquet',
+                    help='File to which to output the final table of identified ORFs. Will be formatted as a parquet file. Different columns of the '
+                         'table indicate various of each ORF, such as start codon, length, etc. (Default: orf.parquet)')
 parser.add_argument('--inbed', default='transcripts.bed', help='Transcriptome BED-file. Annotated CDSs are assumed to be bona fide CDSs, unless '
                                                                '--ignoreannotations is set. (Default: transcripts.bed)')
 parser.add_argument('--codons', nargs='+', default=['ATG'],
@@ -69,60 +70,76 @@ if opts.verbose:
     logprint('Reading transcriptome and genome')
 
 
-def seq_to_regex(inp, flags=0, nucleotide_table=IUPAC_TABLE_DNA):
-    """Convert a nucleotide sequence of IUPAC nucleotide characters as a regular expression.
-    Ambiguous IUPAC characters are converted to groups (e.g. `'Y'` to `'[CTU]'`),
-    and T and U are considered equivalent.
-
-    Modified from the function in plastid.genomics.seqtools
-
-    Parameters
-    ----------
-    inp : str
-        Nucleotide sequence using IUPAC nucleotide codes
-
-    flags : int, optional
-        Flags to pass to :py:func:`re.compile` (Default: 0 / no flags)
-
-    Examples
-    --------
-    Convert a sequence to a regex::
-
-        >>> seq_to_regex("CARYYA").pattern
-        'CA[AG][CTU][CTU]A'
-
-
-    Returns
-    -------
-    :py:class:`re.RegexObject`
-        Regular expression pattern corresponding to IUPAC sequence in `inp`
-    """
-    out = []
-    for ch in inp.upper():
-        if len(nucleotide_table.get(ch, ch)) == 1:
-            out.append(ch)
+# encode nucleotides as small integers for fast codon-table lookups: A/C/G/T => 0..3, anything else (e.g. N) => 4
+_NT_CODE = np.full(256, 4, dtype=np.uint8)
+for (_ntidx, _nt) in enumerate('ACGT'):
+    _NT_CODE[ord(_nt)] = _ntidx
+    _NT_CODE[ord(_nt.lower())] = _ntidx
+
+
+# complement lookup over ASCII, covering the ambiguous IUPAC codes as well (S, W and N are their own complements)
+_NT_COMP = np.arange(256, dtype=np.uint8)
+for (_nt1, _nt2) in [('A', 'T'), ('C', 'G'), ('R', 'Y'), ('K', 'M'), ('B', 'V'), ('D', 'H')]:
+    for (_c1, _c2) in [(_nt1, _nt2), (_nt1.lower(), _nt2.lower())]:
+        _NT_COMP[ord(_c1)], _NT_COMP[ord(_c2)] = ord(_c2), ord(_c1)
+
+
+def _codon_code(codon):
+    """Encode a 3-nucleotide codon as an integer index into _START_TBL/_STOP_TBL"""
+    return (_NT_CODE[ord(codon[0])]*5+_NT_CODE[ord(codon[1])])*5+_NT_CODE[ord(codon[2])]
+
+# lookup tables over all 125 (5**3) encoded codons; any codon containing an ambiguous nucleotide is neither a start nor a stop
+_START_CODONS = sorted(set(''.join(tup) for codon in opts.codons
+                           for tup in product(*[IUPAC_TABLE_DNA[ch] for ch in codon.upper()])))  # concrete codons after IUPAC expansion
+_START_TBL = np.zeros(125, dtype=np.bool_)
+for _codon in _START_CODONS:
+    _START_TBL[_codon_code(_codon)] = True
+_STOP_TBL = np.zeros(125, dtype=np.bool_)
+for _codon in ('TAG', 'TAA', 'TGA'):
+    _STOP_TBL[_codon_code(_codon)] = True
+# maps an encoded start codon to its (int8) category code within _START_CODONS, so codons never need to be materialized as strings
+_CODON_CATCODE = np.full(125, -1, dtype=np.int8)
+for (_cidx, _codon) in enumerate(_START_CODONS):
+    _CODON_CATCODE[_codon_code(_codon)] = _cidx
+
+
+@numba.njit(cache=True)
+def _next_stops(is_stop):
+    """For each position, the position at which the first in-frame stop codon at or after it begins (or -1 if there is none).
+    is_stop flags the positions at which a stop codon begins; the table is built in a single right-to-left pass covering all three frames."""
+    n = len(is_stop)
+    next_stop = np.empty(n, dtype=np.int32)
+    for i in range(n-1, -1, -1):
+        if is_stop[i]:
+            next_stop[i] = i
+        elif i+3 < n:
+            next_stop[i] = next_stop[i+3]
         else:
-            out.append("["+"".join(nucleotide_table.get(ch, ch))+"]")
+            next_stop[i] = -1
+    return next_stop
 
-    return re.compile("".join(out), flags=flags)
 
-START_RE = seq_to_regex('|'.join(opts.codons), nucleotide_table=IUPAC_TABLE_DNA)
-STOP_RE = re.compile(r'(?:...)*?(?:TAG|TAA|TGA)')
-
-# hash transcripts by ID for easy reference later
-with open(opts.inbed, 'rU') as inbed:
-    bedlinedict = {line.split()[3]: line for line in inbed}
+# hash transcripts by ID for easy reference later, and preparse each transcript's exons into compact numpy arrays so that workers never
+# need to re-parse BED text
+bedlinedict = {}
+transcript_exons = {}
+with open(opts.inbed, 'r') as inbed:
+    for line in inbed:
+        ls = line.split()
+        bedlinedict[ls[3]] = line
+        exon_starts = int(ls[1])+np.array(ls[11].rstrip(',').split(','), dtype=np.int32)
+        transcript_exons[ls[3]] = (exon_starts, exon_starts+np.array(ls[10].rstrip(',').split(','), dtype=np.int32))
 
 tfamtids = defaultdict(list)
-with open('%s.txt' % opts.tfamstem, 'rU') as tfamtable:
+with open('%s.txt' % opts.tfamstem, 'r') as tfamtable:
     for line in tfamtable:
         ls = line.strip().split()
         tfamtids[ls[1]].append(ls[0])
 
-with open('%s.bed' % opts.tfamstem, 'rU') as tfambed:
+with open('%s.bed' % opts.tfamstem, 'r') as tfambed:
     tfambedlines = {line.split()[3]: line for line in tfambed}
 
-genome = SeqIO.to_dict(SeqIO.parse(opts.genomefasta, 'fasta'))
+pyfaidx.Fasta(opts.genomefasta, as_raw=True, sequence_always_upper=True).close()  # make sure the .fai index exists before the workers race to build it
 
 if not opts.ignoreannotations:
     annot_tfam_lookups = [tfamtids]
@@ -138,7 +155,7 @@ if opts.extracdsbeds:
 
     tfambedtool = pybedtools.BedTool('%s.bed' % opts.tfamstem)
     for cdsbedfile in opts.extracdsbeds:
-        with open(cdsbedfile, 'rU') as cdsbed:
+        with open(cdsbedfile, 'r') as cdsbed:
             annot_tid_lookups.append({line.split()[3]: line for line in cdsbed})  # as usual, hash bed lines by transcript ID
         annot_tfam_lookups.append(defaultdict(list))
         for line in tfambedtool.intersect(pybedtools.BedTool(cdsbedfile), split=True, s=True, wa=True, wb=True):
@@ -146,23 +163,23 @@ if opts.extracdsbeds:
 # after this has finished, each element of annot_tfam_lookup will be a dictionary mapping tfams to lists of transcript IDs in the annotation bed files
 # similarly, each element of annot_tid_lookup will map transcript IDs to BED lines
 
-tfams_with_annots = set(sum([x.keys() for x in annot_tfam_lookups], []))
+tfams_with_annots = set().union(*(x.keys() for x in annot_tfam_lookups))
 
 
 def _find_all_orfs(myseq):
     """Identify ORFs, or at least starts.
-    Returns list of (start, stop, codon), where stop == 0 if no valid stop codon is present and codon is e.g. 'ATG'.
-    Starts and stops are defined by START_RE and STOP_RE, respectively
+    Returns parallel arrays (starts, stops, codon_codes), where stop == 0 if no valid stop codon is present and codon_codes index into
+    _START_CODONS. Starts and stops are defined by _START_TBL and _STOP_TBL, respectively
     """
-    result = []
-    for i in range(len(myseq)-2):
-        if START_RE.match(myseq[i:i+3]):
-            m = STOP_RE.match(myseq[i:])
-            if m:
-                result.append((i, m.end()+i, myseq[i:i+3]))
-            else:
-                result.append((i, 0, myseq[i:i+3]))
-    return result
+    arr = _NT_CODE[np.frombuffer(myseq.encode(), dtype=np.uint8)]
+    if len(arr) < 3:
+        return (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int8))
+    wins = np.lib.stride_tricks.sliding_window_view(arr, 3)
+    codes = (wins[:, 0].astype(np.int32)*5+wins[:, 1])*5+wins[:, 2]  # encoded codon starting at each position, computed in one vectorized pass
+    starts = np.flatnonzero(_START_TBL[codes]).astype(np.int32)
+    stop_begins = _next_stops(_STOP_TBL[codes])[starts]
+    stops = np.where(stop_begins >= 0, stop_begins+3, 0).astype(np.int32)
+    return (starts, stops, _CODON_CATCODE[codes[starts]])
 
 
 def _name_orf(tfam, gcoord, AAlen):
@@ -174,72 +191,106 @@ def _identify_tfam_orfs(tup):
     """Identify all of the possible ORFs within a family of transcripts. Relevant information such as genomic start and stop positions, amino acid
     length, and initiation codon will be collected for each ORF. Additionally, each ORF will be assigned a unique 'orfname', such that if it occurs
     on multiple transcripts, it can be recognized as the same ORF."""
-    (tfam, tids) = tup
+    (tfam, tid_exons) = tup
+    tids = [tid for (tid, _) in tid_exons]
     currtfam = SegmentChain.from_bed(tfambedlines[tfam])
     chrom = currtfam.chrom
     strand = currtfam.strand
     tfam_genpos = np.array(currtfam.get_position_list())
     if strand == '-':
         tfam_genpos = tfam_genpos[::-1]
-    tmask = np.empty((len(tids), len(tfam_genpos)), dtype=np.bool)  # True if transcript covers that position, False if not
-    tfam_orfs = []
+    pos_to_idx = {pos: i for (i, pos) in enumerate(tfam_genpos.tolist())}  # one hash per tfam position, instead of one np.in1d per transcript
+    gmin = int(tfam_genpos.min())
+    # fetch the tfam's genomic span once; every transcript's spliced sequence is then a fancy-index into this buffer
+    chrom_seq = np.frombuffer(genome[chrom][gmin:int(tfam_genpos.max())+1].encode(), dtype=np.uint8)
+    if strand == '-':
+        chrom_seq = _NT_COMP[chrom_seq]
+    local_idx = tfam_genpos - gmin  # maps (stranded) tfam position index to an offset into chrom_seq
+    tmask_bits = np.zeros((len(tids), (len(tfam_genpos)+7)//8), dtype=np.uint8)  # bit-packed coverage masks, 8x smaller than bool rows
+    nz_pos = []  # per-transcript indices of covered positions (i.e. np.flatnonzero of the coverage mask), cached for the naming loop
+    tmask_sigs = []  # per-transcript footprint signatures (the packed mask bytes themselves); equal signatures mean identical coverage
     tidx_lookup = {}
-    for tidx, tid in enumerate(tids):
+    seen_txs = {}  # transcripts with identical exon structures carry identical ORFs, so each distinct structure is only scanned once
+    # accumulate ORFs as parallel arrays (struct-of-arrays) and build a single DataFrame per tfam at the end, rather than one DataFrame
+    # per transcript followed by a concat
+    all_tidx = []
+    all_tcoord = []
+    all_tstop = []
+    all_gcoord = []
+    all_gstop = []
+    all_AAlen = []
+    all_codon = []
+    for (tidx, (tid, (exon_starts, exon_ends))) in enumerate(tid_exons):
         tidx_lookup[tid] = tidx
-        curr_trans = Transcript.from_bed(bedlinedict[tid])
-        tmask[tidx, :] = np.in1d(tfam_genpos, curr_trans.get_position_list(), assume_unique=True)
-        trans_orfs = _find_all_orfs(curr_trans.get_sequence(genome).upper())
-        if trans_orfs:
-            (startpos, stoppos, codons) = zip(*trans_orfs)
-            startpos = np.array(startpos, dtype='i4')
-            stoppos = np.array(stoppos, dtype='i4')
-
-            gcoords = np.array([curr_trans.get_genomic_coordinate(x)[1] for x in startpos], dtype='i4')
+        tpos_map = np.concatenate([np.arange(start, end, dtype=np.int32) for (start, end) in zip(exon_starts, exon_ends)])
+        if strand == '-':
+            tpos_map = tpos_map[::-1]  # transcript coordinate -> genomic coordinate, 5' to 3'
+        tidx_arr = np.fromiter((pos_to_idx[pos] for pos in tpos_map.tolist()), dtype=np.int32, count=len(tpos_map))
+        currmask = np.zeros(len(tfam_genpos), dtype=np.bool_)
+        currmask[tidx_arr] = True
+        tmask_bits[tidx, :] = np.packbits(currmask)
+        nz_pos.append(tidx_arr)
+        tmask_sigs.append(tmask_bits[tidx, :].tobytes())
+        tx_sig = tidx_arr.tobytes()
+        if tx_sig in seen_txs:
+            (startpos, stoppos, codon_codes, gcoords, gstops, AAlens) = seen_txs[tx_sig]
+        else:
+            (startpos, stoppos, codon_codes) = _find_all_orfs(chrom_seq[local_idx[tidx_arr]].tobytes().decode())
+            gcoords = tpos_map[startpos]
 
             stop_present = (stoppos > 0)
-            gstops = np.zeros(len(trans_orfs), dtype='i4')
-            gstops[stop_present] = \
-                np.array([curr_trans.get_genomic_coordinate(x - 1)[1] for x in stoppos[stop_present]]) + (1 if strand == '+' else -1)
+            gstops = np.where(stop_present, tpos_map[np.maximum(stoppos, 1) - 1] + (1 if strand == '+' else -1), 0).astype('i4')
             # the decrementing/incrementing stuff preserves half-openness regardless of strand
 
-            AAlens = np.zeros(len(trans_orfs), dtype='i4')
-            AAlens[stop_present] = (stoppos[stop_present] - startpos[stop_present])/3 - 1
-            tfam_orfs.append(pd.DataFrame.from_items([('tfam', tfam),
-                                                      ('tid', tid),
-                                                      ('tcoord', startpos),
-                                                      ('tstop', stoppos),
-                                                      ('chrom', chrom),
-                                                      ('gcoord', gcoords),
-                                                      ('gstop', gstops),
-                                                      ('strand', strand),
-                                                      ('codon', codons),
-                                                      ('AAlen', AAlens),
-                                                      ('orfname', '')]))
-    if any(x is not None for x in tfam_orfs):
+            AAlens = np.where(stop_present, (stoppos - startpos)//3 - 1, 0).astype('i4')
+            seen_txs[tx_sig] = (startpos, stoppos, codon_codes, gcoords, gstops, AAlens)
+        if len(startpos):
+            all_tidx.append(np.full(len(startpos), tidx, dtype=np.int32))
+            all_tcoord.append(startpos)
+            all_tstop.append(stoppos)
+            all_gcoord.append(gcoords)
+            all_gstop.append(gstops)
+            all_AAlen.append(AAlens)
+            all_codon.append(codon_codes)
+    if all_tcoord:
         orf_pos_dict = {}
-        tfam_orfs = pd.concat(tfam_orfs, ignore_index=True)
+        norfs = sum(len(x) for x in all_tcoord)
+        tfam_orfs = pd.DataFrame({'tfam': pd.Categorical.from_codes(np.zeros(norfs, dtype=np.int8), categories=[tfam]),
+                                  'tid': pd.Categorical.from_codes(np.concatenate(all_tidx), categories=tids),
+                                  'tcoord': np.concatenate(all_tcoord),
+                                  'tstop': np.concatenate(all_tstop),
+                                  'chrom': pd.Categorical.from_codes(np.zeros(norfs, dtype=np.int8), categories=[chrom]),
+                                  'gcoord': np.concatenate(all_gcoord),
+                                  'gstop': np.concatenate(all_gstop),
+                                  'strand': pd.Categorical.from_codes(np.zeros(norfs, dtype=np.int8), categories=[strand]),
+                                  'codon': pd.Categorical.from_codes(np.concatenate(all_codon), categories=_START_CODONS),
+                                  'AAlen': np.concatenate(all_AAlen),
+                                  'orfname': ''},
+                                 columns=['tfam', 'tid', 'tcoord', 'tstop', 'chrom', 'gcoord', 'gstop', 'strand', 'codon', 'AAlen', 'orfname'])
         for ((gcoord, AAlen), gcoord_grp) in tfam_orfs.groupby(['gcoord', 'AAlen']):  # group by genomic start position and length
             if len(gcoord_grp) == 1:
                 tfam_orfs.loc[gcoord_grp.index, 'orfname'] = _name_orf(tfam, gcoord, AAlen)
             else:
-                orf_gcoords = np.vstack(np.flatnonzero(tmask[tidx_lookup[tid], :])[tcoord:tstop]
-                                        for (tid, tcoord, tstop) in gcoord_grp[['tid', 'tcoord', 'tstop']].itertuples(False))
-                if (orf_gcoords == orf_gcoords[0, :]).all():  # all of the grouped ORFs are identical, so should receive the same name
+                group_tidxs = [tidx_lookup[tid] for tid in gcoord_grp['tid']]
+                if len(set(tmask_sigs[tidx] for tidx in group_tidxs)) == 1:
+                    # identical coverage masks guarantee identical ORFs, so skip materializing the coordinate rows entirely
+                    orfname = _name_orf(tfam, gcoord, AAlen)
+                    tfam_orfs.loc[gcoord_grp.index, 'orfname'] = orfname
+                    (tcoord, tstop) = gcoord_grp[['tcoord', 'tstop']].iloc[0]
+                    orf_pos_dict[orfname] = tfam_genpos[nz_pos[group_tidxs[0]][tcoord:tstop]]
+                    continue
+                orf_gcoords = np.vstack([nz_pos[tidx_lookup[tid]][tcoord:tstop]
+                                         for (tid, tcoord, tstop) in gcoord_grp[['tid', 'tcoord', 'tstop']].itertuples(False)])
+                (uniq_gcoords, uniq_idx) = np.unique(orf_gcoords, axis=0, return_inverse=True)
+                if len(uniq_gcoords) == 1:  # all of the grouped ORFs are identical, so should receive the same name
                     orfname = _name_orf(tfam, gcoord, AAlen)
                     tfam_orfs.loc[gcoord_grp.index, 'orfname'] = orfname
-                    orf_pos_dict[orfname] = tfam_genpos[orf_gcoords[0, :]]
+                    orf_pos_dict[orfname] = tfam_genpos[uniq_gcoords[0]]
                 else:
-                    named_so_far = 0
-                    unnamed = np.ones(len(gcoord_grp), dtype=np.bool)
                     basename = _name_orf(tfam, gcoord, AAlen)
-                    while unnamed.any():
-                        next_gcoords = orf_gcoords[unnamed, :][0, :]
-                        identicals = (orf_gcoords == next_gcoords).all(1)
-                        orfname = '%s_%d' % (basename, named_so_far)
-                        tfam_orfs.loc[gcoord_grp.index[identicals], 'orfname'] = orfname
-                        orf_pos_dict[orfname] = tfam_genpos[next_gcoords]
-                        unnamed[identicals] = False
-                        named_so_far += 1
+                    tfam_orfs.loc[gcoord_grp.index, 'orfname'] = ['%s_%d' % (basename, i) for i in uniq_idx]
+                    for (i, next_gcoords) in enumerate(uniq_gcoords):
+                        orf_pos_dict['%s_%d' % (basename, i)] = tfam_genpos[next_gcoords]
 
         # Now that the ORFs have been found and named, figure out their orftype
         tfam_orfs['annot_start'] = False
@@ -261,12 +312,12 @@ def _identify_tfam_orfs(tup):
                                 curr_gcoord = curr_trans.get_genomic_coordinate(curr_trans.cds_start)[1]
                                 curr_gstop = curr_trans.get_genomic_coordinate(curr_trans.cds_end - 1)[1] + (1 if strand == '+' else -1)
                                 in_tfam = curr_cds_pos_set.issubset(tfam_genpos)
-                                cds_info.append((curr_gcoord, curr_gstop, (curr_len-3)/3, in_tfam, annot_fidx, annot_tid, curr_cds_pos_set))
+                                cds_info.append((curr_gcoord, curr_gstop, (curr_len-3)//3, in_tfam, annot_fidx, annot_tid, curr_cds_pos_set))
                                 all_annot_pos.update(curr_cds_pos_set)
             if cds_info:  # False means no annotated CDSs or none are multiples of 3 in length
                 cds_info = pd.DataFrame(cds_info, columns=['gcoord', 'gstop', 'AAlen', 'in_tfam', 'annot_fidx', 'annot_tid', 'pos']) \
                     .groupby(['gcoord', 'gstop', 'AAlen', 'in_tfam'], as_index=False) \
-                    .apply(lambda x: x if len(x) == 1 else x[[not any(pos == x['pos'].iat[j] for j in xrange(i))
+                    .apply(lambda x: x if len(x) == 1 else x[[not any(pos == x['pos'].iat[j] for j in range(i))
                                                               for (i, pos) in enumerate(x['pos'])]]) \
                     .set_index(['annot_fidx', 'annot_tid'])
                 # this operation organizes cds_info into a dataframe and effectively drops duplicates
@@ -282,7 +333,7 @@ def _identify_tfam_orfs(tup):
                     else:
                         if tid is None or tcoord is None or tstop is None:
                             (tid, tcoord, tstop) = tfam_orfs.loc[tfam_orfs['orfname'] == orfname, ['tid', 'tcoord', 'tstop']].iloc[0]
-                        res = tfam_genpos[np.flatnonzero(tmask[tidx_lookup[tid], :])[tcoord:tstop]]
+                        res = tfam_genpos[nz_pos[tidx_lookup[tid]][tcoord:tstop]]
                         orf_pos_dict[orfname] = res
                         return res
 
@@ -464,20 +515,50 @@ def _identify_tfam_orfs(tup):
 if opts.verbose:
     logprint('Identifying ORFs within each transcript family')
 
-workers = mp.Pool(opts.numproc)
-all_orfs = pd.concat(workers.map(_identify_tfam_orfs, tfamtids.iteritems()), ignore_index=True)
+def _init_worker():
+    """Per-worker setup: open a process-local genome handle (memory-mapped, so chromosomes are never materialized in RAM) and warm the
+    scanner JIT. Run from an initializer rather than inherited over fork, so no heavy state needs to live in the parent."""
+    global genome
+    genome = pyfaidx.Fasta(opts.genomefasta, as_raw=True, sequence_always_upper=True)
+    _find_all_orfs('ATGTGA')
+
+
+_ORF_SCHEMA = pa.schema([('tfam', pa.string()),
+                         ('tid', pa.string()),
+                         ('tcoord', pa.int32()),
+                         ('tstop', pa.int32()),
+                         ('chrom', pa.string()),
+                         ('gcoord', pa.int32()),
+                         ('gstop', pa.int32()),
+                         ('strand', pa.string()),
+                         ('codon', pa.string()),
+                         ('AAlen', pa.int32()),
+                         ('orfname', pa.string()),
+                         ('annot_start', pa.bool_()),
+                         ('annot_stop', pa.bool_()),
+                         ('orftype', pa.string())])
+
+_ROW_GROUP_SIZE = 100000  # rows per parquet row group; one group per tfam would bloat the footer and slow downstream filtered scans
+
+workers = mp.Pool(opts.numproc, initializer=_init_worker)
+with pq.ParquetWriter(opts.orfstore, _ORF_SCHEMA, compression='zstd') as writer:
+    # stream each tfam's table into the file as it arrives, rather than holding every result for one big concat; the discrete columns are
+    # dictionary-encoded by parquet automatically, and there is no second ptrepack pass over the output
+    buffered_tables = []
+    buffered_rows = 0
+    for tfam_orfs in workers.imap_unordered(_identify_tfam_orfs,
+                                            ((tfam, [(tid, transcript_exons[tid]) for tid in tids]) for (tfam, tids) in tfamtids.items()),
+                                            chunksize=max(1, len(tfamtids)//(opts.numproc*8))):
+        if tfam_orfs is not None:
+            buffered_tables.append(pa.Table.from_pandas(tfam_orfs, schema=_ORF_SCHEMA, preserve_index=False))
+            buffered_rows += len(tfam_orfs)
+            if buffered_rows >= _ROW_GROUP_SIZE:
+                writer.write_table(pa.concat_tables(buffered_tables))
+                buffered_tables = []
+                buffered_rows = 0
+    if buffered_tables:
+        writer.write_table(pa.concat_tables(buffered_tables))
 workers.close()
 
-for catfield in ['chrom', 'strand', 'codon', 'orftype']:
-    all_orfs[catfield] = all_orfs[catfield].astype('category')  # saves disk space and read/write time
-
-if opts.verbose:
-    logprint('Saving results')
-
-origname = opts.orfstore+'.tmp'
-all_orfs.to_hdf(origname, 'all_orfs', format='t', data_columns=True)
-sp.call(['ptrepack', origname, opts.orfstore])  # repack for efficiency
-os.remove(origname)
-
 if opts.verbose:
     logprint('Tasks complete')
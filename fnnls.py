@@ -0,0 +1,56 @@
+import numpy
+
+# The fast NNLS algorithm of Bro and de Jong (J Chemometrics 11:393-401, 1997). Unlike classic Lawson-Hanson (scipy.optimize.nnls), it operates
+# on the normal equations (AtA, Atb) rather than the design matrix itself, so the design never needs to be densified and each iteration costs
+# O(K^2) in the number of unknowns rather than O(rows).
+
+
+def fnnls(AtA, Atb, tol=None, max_iter=None):
+    """Solve min ||Ax-b|| subject to x >= 0, given the precomputed normal equations
+
+    Parameters
+    ----------
+    AtA : numpy.ndarray
+        A.T.dot(A); symmetric positive (semi)definite, shape (K, K)
+
+    Atb : numpy.ndarray
+        A.T.dot(b), shape (K,)
+
+    tol : float, optional
+        Tolerance for judging gradient entries to be effectively zero. Defaults to the standard
+        10 * eps * max(abs(AtA)) * K
+
+    max_iter : int, optional
+        Iteration limit; defaults to 30*K, which is essentially never reached in practice
+
+    Returns
+    -------
+    numpy.ndarray
+        The nonnegative solution vector x, shape (K,)
+    """
+    K = len(Atb)
+    if K == 1:  # one-unknown problems are common (small tfams after filtering) and have a closed form; skip the active-set machinery
+        return numpy.array([max(Atb[0]/AtA[0, 0], 0.)])
+    if tol is None:
+        tol = 10.*numpy.finfo(AtA.dtype).eps*numpy.abs(AtA).max()*K
+    if max_iter is None:
+        max_iter = 30*K
+    passive = numpy.zeros(K, dtype=bool)  # the passive set: unknowns currently allowed to be positive
+    x = numpy.zeros(K)
+    w = Atb.astype(numpy.float64, copy=True)  # gradient Atb - AtA.dot(x), which starts at Atb since x starts at 0
+    for _ in range(max_iter):
+        if passive.all() or w[~passive].max() <= tol:
+            break  # KKT conditions satisfied
+        passive[int(numpy.where(passive, -numpy.inf, w).argmax())] = True
+        s = numpy.zeros(K)
+        s[passive] = numpy.linalg.solve(AtA[numpy.ix_(passive, passive)], Atb[passive])
+        while passive.any() and s[passive].min() <= 0.:  # inner loop: back off along the line from x to s until the solution is feasible
+            backoff = (passive & (s <= 0.))
+            alpha = (x[backoff]/(x[backoff]-s[backoff])).min()
+            x += alpha*(s-x)
+            passive &= (x > tol)
+            s[:] = 0.
+            s[passive] = numpy.linalg.solve(AtA[numpy.ix_(passive, passive)], Atb[passive])
+        x = s
+        w = Atb-AtA.dot(x)
+    return x
@@ -25,7 +25,7 @@ def read_length_nmis(read):
     nmis : int
         Number of 5' mismatches trimmed
     """
-    nmis = len((NMIS_RE_MINUS if read.is_reverse else NMIS_RE_PLUS).search(read.opt('MD')).group())/2
+    nmis = len((NMIS_RE_MINUS if read.is_reverse else NMIS_RE_PLUS).search(read.opt('MD')).group())//2
     return len(read.positions)-nmis, nmis
 
 
@@ -88,7 +88,7 @@ def ReadKeyMapFactory(offset_dict, read_key_fun=lambda read: len(read.positions)
                     count_array[read_key][p_site - seg.start] += 1
         return count_array
         # return reads_out, count_array
-    map_func.read_keys = offset_dict.keys()
+    map_func.read_keys = list(offset_dict.keys())
     map_func.read_key_fun = read_key_fun
     map_func.__doc__ = docstring
     return map_func
@@ -147,9 +147,9 @@ class HashedReadBAMGenomeArray(BAMGenomeArray):
 
         # filter by strand
         if roi.strand == "+":
-            reads = itertools.ifilter(lambda x: not x.is_reverse, reads)
+            reads = filter(lambda x: not x.is_reverse, reads)
         elif roi.strand == "-":
-            reads = itertools.ifilter(lambda x: x.is_reverse, reads)
+            reads = filter(lambda x: x.is_reverse, reads)
 
         # Pass through additional filters (e.g. size filters, if they have
         # been added)
@@ -161,10 +161,10 @@ class HashedReadBAMGenomeArray(BAMGenomeArray):
 
         # normalize to reads per million of normalization flag is set
         if self._normalize:
-            count_dict = {k: v*1.0e6/self.sum() for (k, v) in count_dict.iteritems()}
+            count_dict = {k: v*1.0e6/self.sum() for (k, v) in count_dict.items()}
 
         if roi_order and roi.strand == "-":
-            count_dict = {k: v[::-1] for (k, v) in count_dict.iteritems()}
+            count_dict = {k: v[::-1] for (k, v) in count_dict.items()}
 
         return reads, count_dict
 
@@ -201,7 +201,7 @@ class HashedReadBAMGenomeArray(BAMGenomeArray):
         return reads, sum(count_dict.values(), numpy.zeros(len(roi)))
 
 
-def get_hashed_counts(segchain, hashedgnd, stranded=True):
+def get_hashed_counts(segchain, hashedgnd, stranded=True, sum_over_nmis=False):
     """Returns a dict of counts of IVCollection as a list of positions, in
        transcript coordinates, keyed according to hashedgnd
 
@@ -219,18 +219,33 @@ def get_hashed_counts(segchain, hashedgnd, stranded=True):
         array positions march from the 5' to 3' end of the chain.
         (Default: `True`)
 
+    sum_over_nmis : bool, optional
+        If `True`, assume read keys are (rdlen, nmis) tuples and sum
+        the counts over nmis, returning a 2D array with one row per
+        read length (rows in ascending rdlen order) instead of a dict.
+        (Default: `False`)
+
 
     Returns
     -------
-    numpy.ndarray
-        Array of counts from `gnd` covering `self`
+    dict or numpy.ndarray
+        Counts from `gnd` covering `self`, keyed according to the
+        mapping function, or a (num read lengths, chain length) array
+        if sum_over_nmis is `True`
     """
     dcnt = {k: [] for k in hashedgnd.map_fn.read_keys}
     for iv in segchain:
         _, dtmp = hashedgnd.get_reads_and_hashed_counts(iv, roi_order=False)
-        for (k, v) in dcnt.iteritems():
+        for (k, v) in dcnt.items():
             v.extend(dtmp[k])
     if stranded and segchain.strand == "-":
-        for v in dcnt.itervalues():
+        for v in dcnt.values():
             v.reverse()
+    if sum_over_nmis:
+        rdlens = sorted({rdlen for (rdlen, nmis) in dcnt})
+        rdlen_rows = {rdlen: i for (i, rdlen) in enumerate(rdlens)}
+        summed = numpy.zeros((len(rdlens), segchain.get_length()))
+        for ((rdlen, nmis), v) in dcnt.items():
+            summed[rdlen_rows[rdlen], :] += v
+        return summed
     return dcnt
@@ -27,7 +27,7 @@ if opts.color:
     mycolors = brewer2mpl.get_map(opts.color.title(), 'Sequential', 9).colors
 
 # hash transcripts by ID for easy reference later
-with open(opts.inbed, 'rU') as inbed:
+with open(opts.inbed, 'r') as inbed:
     bedlinedict = {line.split()[3]: line for line in inbed}
 
 ratedorfs = pd.read_hdf(opts.ratingsfile, 'orfratings', mode='r', columns=['orfname', 'tid', 'gcoord', 'gstop', 'strand', 'orfrating'],
@@ -48,7 +48,7 @@ tfams = {}  # will contain integer keys to a tuple: ([list of tid],(chrom,strand
 genlookup = defaultdict(dict)  # indexed by (chrom,strand) keys to an integer key to tfam
 next_tfam = 0
 processed = 0
-with open(opts.inbed, 'rU') as inbed:
+with open(opts.inbed, 'r') as inbed:
     for trans in BED_Reader(inbed):
         pos_set = trans.get_position_set()
         currfams = {genlookup[(trans.chrom, trans.strand)][pos] for pos in pos_set if pos in genlookup[(trans.chrom, trans.strand)]}
@@ -112,7 +112,7 @@ if opts.verbose:
     logprint('Assigning names to transcript families')
 
 if opts.genenames:
-    with open(opts.genenames, 'rU') as infile:
+    with open(opts.genenames, 'r') as infile:
         gene_name_lookup = {x[0]: x[1] for x in [line.strip().split() for line in infile]}
 # gene_name_lookup = pd.read_csv(opts.genenames,sep='\t',header=None,names=['tid','tfam']).set_index('tid')['tfam'].to_dict()
 else:
@@ -120,7 +120,7 @@ else:
 
 new_tfams = {}
 multi_names = defaultdict(lambda: int(1))
-for tfam_val in tfams.itervalues():
+for tfam_val in tfams.values():
     geneset = {gene_name_lookup[tid] for tid in tfam_val[0] if tid in gene_name_lookup}
     if not geneset:
         geneset = set(tfam_val[0])  # if no gene names available, just use the tids themselves
@@ -129,7 +129,7 @@ for tfam_val in tfams.itervalues():
         multi_names[genename] += 1
         genename = '%s_%d' % (genename, multi_names[genename])
     new_tfams[genename] = tfam_val
-for (genename, num_appearances) in multi_names.iteritems():
+for (genename, num_appearances) in multi_names.items():
     sys.stderr.write('WARNING: Gene name %s appears %d independent times\n' % (genename, num_appearances))
 
 if opts.verbose:
@@ -137,7 +137,7 @@ if opts.verbose:
 
 with open(outbedname, 'w') as outbed:
     with open(outtxtname, 'w') as outtxt:
-        for tfam, (tids, (chrom, strand), genpos) in new_tfams.iteritems():
+        for tfam, (tids, (chrom, strand), genpos) in new_tfams.items():
             outbed.write(SegmentChain(*positionlist_to_segments(chrom, strand, list(genpos)), ID=tfam).as_bed())
             for tid in tids:
                 outtxt.write('%s\t%s\n' % (tid, tfam))
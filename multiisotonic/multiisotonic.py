@@ -45,9 +45,9 @@ class MultiIsotonicRegressor(BaseEstimator, RegressorMixin):
         for (i, Xrow) in enumerate(self._training_set[:, 1:]):
             indices.append(np.flatnonzero((Xrow <= self._training_set[i+1:, 1:]).all(1))+i+1)
             indptr.append(indptr[-1]+len(indices[-1]))
-        all_comparisons = sparse.csr_matrix((np.ones(indptr[-1], dtype=np.bool), np.concatenate(indices), indptr),
-                                            shape=(X.shape[0], X.shape[0]), dtype=np.bool)
-        edges_to_add = zip(*(all_comparisons-all_comparisons.dot(all_comparisons)).nonzero())
+        all_comparisons = sparse.csr_matrix((np.ones(indptr[-1], dtype=bool), np.concatenate(indices), indptr),
+                                            shape=(X.shape[0], X.shape[0]), dtype=bool)
+        edges_to_add = list(zip(*(all_comparisons-all_comparisons.dot(all_comparisons)).nonzero()))
         mygraph = igraph.Graph(n=y.size, edges=edges_to_add, directed=True, vertex_attrs={'y': ysort})
 
         def _add_source_sink(graph_part):
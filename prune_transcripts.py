@@ -8,7 +8,6 @@ from plastid.genomics.roitools import SegmentChain
 import pysam
 from collections import defaultdict
 from Bio import SeqIO
-from string import maketrans
 import pandas as pd
 import numpy as np
 import multiprocessing as mp
@@ -20,7 +19,7 @@ parser = argparse.ArgumentParser(description='Use ribosome profiling data to rem
                                              'with another transcript), or if they have more multimapping reads beyond what would be expected based '
                                              'on the number of multimapping positions. It is recommended that this file be run in an empty directory '
                                              'and that OUTBED remain at the default value ("transcripts.bed") for consistency with later scripts.')
-parser.add_argument('--inbed', type=argparse.FileType('rU'), default=sys.stdin, help='Transcriptome BED-file (Default: stdin)')
+parser.add_argument('--inbed', type=argparse.FileType('r'), default=sys.stdin, help='Transcriptome BED-file (Default: stdin)')
 parser.add_argument('genomefasta', help='Path to genome FASTA-file')
 parser.add_argument('bamfiles', nargs='+', help='Path to transcriptome-aligned BAM file(s) to use for transcript filtering purposes. Alignment '
                                                 'should report all possible multimapping positions for each read. Ideally, should be ribosome '
@@ -71,10 +70,10 @@ if opts.verbose:
     log_lock = mp.Lock()
 
 fpsize = opts.minlen
-psite = (fpsize + 1) / 2
+psite = (fpsize + 1) // 2
 
 if opts.pseudogenes:
-    with open(opts.pseudogenes, 'rU') as inpseudo:
+    with open(opts.pseudogenes, 'r') as inpseudo:
         pseudotids = {line.strip() for line in inpseudo}
 else:
     pseudotids = {}
@@ -91,7 +90,7 @@ if ntids == 0:
     raise EOFError('Insufficient input or empty file provided')
 
 genome = SeqIO.to_dict(SeqIO.parse(opts.genomefasta, 'fasta'))
-str_dict = maketrans('ACGTacgt', '01230123')
+str_dict = str.maketrans('ACGTacgt', '01230123')
 
 temp_folder = 'tid_seq_info_temp'
 if os.path.exists(temp_folder):
@@ -119,7 +118,7 @@ def _get_tid_info(tup):
     tid_summary = pd.DataFrame(
         {'chrom': chrom, 'strand': strand, 'n_psite': -1, 'n_reads': -1, 'peak_reads': -1, 'dropped': ''},
         index=pd.Index(bedlinedict[(chrom, strand)].keys(), name='tid'))
-    for (tid, line) in bedlinedict[(chrom, strand)].iteritems():
+    for (tid, line) in bedlinedict[(chrom, strand)].items():
         currtrans = SegmentChain.from_bed(line)
         curr_pos_list = currtrans.get_position_list()  # not in stranded order!
         if strand == '-':
@@ -140,7 +139,7 @@ def _get_tid_info(tup):
                     tid_seq_info.append(pd.DataFrame({'tid': tid,
                                                       'genpos': curr_pos_list[psite:n_psite + psite],
                                                       'seq': np.array([(int(curr_seq[i:i + fpsize], 4) if 'N' not in curr_seq[i:i + fpsize] else -1)
-                                                                       for i in xrange(n_psite)], dtype=np.int64),
+                                                                       for i in range(n_psite)], dtype=np.int64),
                                                       'reads': curr_counts}))
                 else:
                     tid_summary.at[tid, 'dropped'] = 'peakfrac'
@@ -283,7 +282,7 @@ if pseudos.size > 0:
     tid_info['psite_mm_frac'] = tid_info['mm_psite'] / tid_info['n_psite']
 
 if not opts.keeptempfiles:
-    for partnum in xrange(npart):
+    for partnum in range(npart):
         try:
             os.remove(outname % partnum)  # no longer needed
         except OSError:
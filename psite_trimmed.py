@@ -24,7 +24,7 @@ parser.add_argument('--offsetfile', default='offsets.txt',
                     help='Output file. Two columns of tab-delimited text; first column indicates read length, second column indicates offset to '
                          'apply. Read lengths are calculated after trimming 5\' mismatches. If SUBDIR is set, this file will be placed in that '
                          'directory. (Default: offsets.txt)')
-parser.add_argument('--cdsbed', type=argparse.FileType('rU'), default=sys.stdin,
+parser.add_argument('--cdsbed', type=argparse.FileType('r'), default=sys.stdin,
                     help='BED-file containing annotated CDSs whose start codons are to be used to identify P-site offsets (Default: stdin)')
 parser.add_argument('--minrdlen', type=int, default=27, help='Minimum permitted read length, inclusive (Default: 27)')
 parser.add_argument('--maxrdlen', type=int, default=34, help='Maximum permitted read length, inclusive (Default: 34)')
@@ -83,21 +83,22 @@ def _offset_to_gcoord(read, gcoord):
 def _get_reads(chrom, strand, gcoord, inbams):
     """Get all of the reads overlapping a specific genomic position"""
     if strand == '+':
-        return itertools.ifilter(lambda rd: not rd.is_reverse,
+        return filter(lambda rd: not rd.is_reverse,
                                  itertools.chain.from_iterable((bamfile.fetch(reference=chrom,
                                                                               start=gcoord,
                                                                               end=gcoord+1) for bamfile in inbams)))
     else:  # strand == '-'
-        return itertools.ifilter(lambda rd: rd.is_reverse,
+        return filter(lambda rd: rd.is_reverse,
                                  itertools.chain.from_iterable((bamfile.fetch(reference=chrom,
                                                                               start=gcoord,
                                                                               end=gcoord+1) for bamfile in inbams)))
 
 
-def _map_start_sites((chrom, strand)):
+def _map_start_sites(chrom_strand):
     """Tally reads by read length and offset from translation start sites, for a particular chromsome and strand. Each read contributes the same
     amount, so a start position with more reads will contribute more than one with fewer"""
 
+    (chrom, strand) = chrom_strand
     inbams = [pysam.Samfile(infile, 'rb') for infile in opts.bamfiles]
     offset_tallies = np.zeros((opts.maxrdlen+1-opts.minrdlen, opts.maxrdlen), np.uint32)
     for gcoord in gcoorddict[(chrom, strand)]:
@@ -120,7 +121,7 @@ if opts.verbose:
 
 if opts.tallyfile:
     with open(tallyfilename, 'w') as outfile:
-        for rdlen in xrange(opts.minrdlen, opts.maxrdlen+1):
+        for rdlen in range(opts.minrdlen, opts.maxrdlen+1):
             outfile.write('\t'.join([str(rdlen)]+[str(tally) for tally in offset_tallies[rdlen-opts.minrdlen, :]])+'\n')
 
 # Strategy for determining P-site offsets: find the P-site for the most common read length the simple way (argmax), then see how much each other
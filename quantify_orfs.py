@@ -82,7 +82,7 @@ if opts.verbose:
 
 rdlens = []
 Pdict = {}
-with open(offsetfilename, 'rU') as infile:
+with open(offsetfilename, 'r') as infile:
     for line in infile:
         ls = line.strip().split()
         rdlen = int(ls[0])
@@ -92,7 +92,7 @@ with open(offsetfilename, 'rU') as infile:
 rdlens.sort()
 
 # hash transcripts by ID for easy reference later
-with open(opts.inbed, 'rU') as inbed:
+with open(opts.inbed, 'r') as inbed:
     bedlinedict = {line.split()[3]: line for line in inbed}
 
 with pd.HDFStore(opts.ratingsfile, mode='r') as ratingstore:
@@ -134,7 +134,7 @@ def _quantify_tfam(orf_set, gnds):
         all_tfam_genpos = all_tfam_genpos[::-1]
     nnt = len(all_tfam_genpos)
     tid_indices = {tid: np.flatnonzero(np.in1d(all_tfam_genpos, list(curr_tid_genpos), assume_unique=True))
-                   for (tid, curr_tid_genpos) in tid_genpos.iteritems()}
+                   for (tid, curr_tid_genpos) in tid_genpos.items()}
     orf_matrix = np.zeros((nnt, len(orf_set)))
     ignore_coords = []
     for (orf_num, (tid, tcoord, tstop, AAlen)) in enumerate(orf_set[['tid', 'tcoord', 'tstop', 'AAlen']].itertuples(False)):
@@ -143,7 +143,7 @@ def _quantify_tfam(orf_set, gnds):
         ignore_coords.append(tid_indices[tid][max(tstop+stopmask[0], 0):tstop+stopmask[1]])
     ignore_coords = np.unique(np.concatenate(ignore_coords))
     orf_matrix[ignore_coords, :] = 0  # mask out all positions within the mask region around starts and stops
-    valid_orfs = np.array([(orf_matrix[:, i] > 0).any() and (orf_matrix.T[i, :] != orf_matrix.T[:i, :]).any(1).all() for i in xrange(len(orf_set))])
+    valid_orfs = np.array([(orf_matrix[:, i] > 0).any() and (orf_matrix.T[i, :] != orf_matrix.T[:i, :]).any(1).all() for i in range(len(orf_set))])
     # require at least one valid position, and if >1 ORFs are identical, only include one of them
     orf_matrix[:, ~valid_orfs] = 0  # completely ignore these positions
     valid_nts = (orf_matrix > 0).any(1)  # only bother checking nucleotides where there is a valid ORF
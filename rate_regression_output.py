@@ -18,8 +18,8 @@ parser.add_argument('regressfile', nargs='+',
                          'rating. If directory(ies) are provided, they should contain a file named regression.h5. Datasets treated with translation '
                          'inititation inhibitors (e.g. HARR, LTM) for which the --startonly toggle was set in regress_orfs.py will only be used for '
                          'initiation codon results; other datasets will be used for both initiation and termination codons.')
-parser.add_argument('--orfstore', default='orf.h5',
-                    help='Path to pandas HDF store containing ORFs and ORF types; generated by find_orfs_and_types.py (Default: orf.h5)')
+parser.add_argument('--orfstore', default='orf.parquet',
+                    help='Path to parquet file containing ORFs and ORF types; generated by find_orfs_and_types.py (Default: orf.parquet)')
 parser.add_argument('--names', nargs='+', help='Names to use for datasets included in REGRESSFILEs. Should meaningfully indicate the important '
                                                'features of each. (Default: inferred from REGRESSFILEs)')
 parser.add_argument('--numtrees', type=int, default=2048, help='Number of trees to use in the random forest (Default: 2048)')
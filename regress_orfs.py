@@ -1,16 +1,28 @@
 #! /usr/bin/env python
 
 import argparse
+import functools
 import os
+
+# keep BLAS single-threaded: the process pool provides the parallelism, and letting every worker spawn a thread per core oversubscribes the
+# machine. Must be set before numpy/scipy are imported
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+os.environ.setdefault('MKL_NUM_THREADS', '1')
+os.environ.setdefault('OPENBLAS_NUM_THREADS', '1')
+
+from concurrent.futures import ThreadPoolExecutor
 import pysam
 import pandas as pd
 import numpy as np
-from scipy.optimize import nnls
+import numba
+import scipy.linalg
 import scipy.sparse
+from fnnls import fnnls
 import multiprocessing as mp
 from hashed_read_genome_array import HashedReadBAMGenomeArray, ReadKeyMapFactory, read_length_nmis, get_hashed_counts
-from plastid.genomics.roitools import SegmentChain, positionlist_to_segments
+from plastid.genomics.roitools import GenomicSegment, SegmentChain
 import sys
+import threading
 from time import strftime
 
 parser = argparse.ArgumentParser(description='Use linear regression to identify likely sites of translation. Regression will be performed for ORFs '
@@ -33,8 +45,8 @@ parser.add_argument('--minwstart', type=float, nargs='+', default=[0],
                     help='Minimum W_start statistic to require for regression output in RESTRICTBYSTARTS. If only one value is given, it will be '
                          'assumed to apply to all; if multiple values are given, the number of values must match the number of values provided for '
                          'RESTRICTBYSTARTS. Ignored if RESTRICTBYSTARTS not included. (Default: 0)')
-parser.add_argument('--orfstore', default='orf.h5',
-                    help='Path to pandas HDF store containing ORFs to regress; generated by find_orfs_and_types.py (Default: orf.h5)')
+parser.add_argument('--orfstore', default='orf.parquet',
+                    help='Path to parquet file containing ORFs to regress; generated by find_orfs_and_types.py (Default: orf.parquet)')
 parser.add_argument('--inbed', default='transcripts.bed', help='Transcriptome BED-file (Default: transcripts.bed)')
 parser.add_argument('--offsetfile', default='offsets.txt',
                     help='Path to 2-column tab-delimited file with 5\' offsets for variable P-site mappings. First column indicates read length, '
@@ -68,7 +80,8 @@ parser.add_argument('--metagenefile', default='metagene.txt',
 parser.add_argument('--noregress', action='store_true', help='Only generate a metagene (i.e. do not perform any regressions)')
 parser.add_argument('--exclude', nargs='+', help='Names of transcript families (tfams) to exclude from analysis due to excessive computational time '
                                                  'or memory footprint (e.g. TTN can be so large that the regression never finishes).')
-parser.add_argument('-v', '--verbose', action='count', help='Output a log of progress and timing (to stdout). Repeat for higher verbosity level.')
+parser.add_argument('-v', '--verbose', action='count', default=0,
+                    help='Output a log of progress and timing (to stdout). Repeat for higher verbosity level.')
 parser.add_argument('-p', '--numproc', type=int, default=1, help='Number of processes to run. Defaults to 1 but more recommended if available.')
 parser.add_argument('-f', '--force', action='store_true',
                     help='Force file overwrite. This will overwrite both METAGENEFILE and REGRESSFILE, if they exist. To overwrite only REGRESSFILE '
@@ -110,7 +123,7 @@ if opts.verbose:
 
 rdlens = []
 Pdict = {}
-with open(offsetfilename, 'rU') as infile:
+with open(offsetfilename, 'r') as infile:
     for line in infile:
         ls = line.strip().split()
         rdlen = int(ls[0])
@@ -123,51 +136,104 @@ with open(offsetfilename, 'rU') as infile:
 rdlens.sort()
 
 # hash transcripts by ID for easy reference later
-with open(opts.inbed, 'rU') as inbed:
+with open(opts.inbed, 'r') as inbed:
     bedlinedict = {line.split()[3]: line for line in inbed}
 
 
-def _get_annotated_counts_by_chrom(chrom_to_do):
+class _TransCache(object):
+    """Lazily parsed transcripts: maps a transcript ID to its SegmentChain and sorted genomic position array, parsing each BED line at most
+    once per process. Each chromosome's transcripts are disjoint, so per-worker caches stay bounded."""
+
+    def __init__(self, bedlines):
+        self._bedlines = bedlines
+        self._parsed = {}
+
+    def __getitem__(self, tid):
+        if tid not in self._parsed:
+            currtrans = SegmentChain.from_bed(self._bedlines[tid])
+            curr_pos_array = np.fromiter(currtrans.get_position_set(), dtype=np.int64, count=currtrans.get_length())
+            curr_pos_array.sort()
+            self._parsed[tid] = (currtrans, curr_pos_array)
+        return self._parsed[tid]
+
+
+transcripts = _TransCache(bedlinedict)
+
+
+_gnd_local = threading.local()
+
+
+def _get_gnd():
+    """The genome array for the current thread, with its own BAM handles opened on first use. pysam/htslib file handles are not thread-safe,
+    so each thread needs a private set; opening them lazily still means once per worker on the serial path, rather than per chromosome."""
+    if not hasattr(_gnd_local, 'gnd'):
+        _gnd_local.gnd = HashedReadBAMGenomeArray([pysam.Samfile(infile, 'rb') for infile in opts.bamfiles],
+                                                  ReadKeyMapFactory(Pdict, read_length_nmis))
+    return _gnd_local.gnd
+
+
+def _init_worker():
+    """Open each worker's main-thread BAM handles up front rather than on the first task."""
+    _get_gnd()
+
+
+@numba.njit(cache=True)
+def _accumulate_cds(curr, startlen, stoplen, mincdsreads, startprof, cdsprof, stopprof):
+    """Check one CDS window's per-rdlen counts against the read threshold and, if it passes, normalize by the mean and add it into the
+    metagene profiles in place. Returns 1 if the CDS was included, 0 otherwise."""
+    (nrd, cdslen) = curr.shape
+    total = curr.sum()
+    if total < mincdsreads:
+        return 0
+    scale = curr.size/total  # normalize by mean of counts across all readlengths and positions within the CDS
+    for i in range(nrd):
+        for j in range(startlen):
+            startprof[i, j] += curr[i, j]*scale
+    ncodons = (cdslen-startlen-stoplen)//3
+    for i in range(nrd):
+        s0 = 0.
+        s1 = 0.
+        s2 = 0.
+        for c in range(ncodons):
+            base = startlen+3*c
+            s0 += curr[i, base]
+            s1 += curr[i, base+1]
+            s2 += curr[i, base+2]
+        cdsprof[i, 0] += s0*scale/ncodons
+        cdsprof[i, 1] += s1*scale/ncodons
+        cdsprof[i, 2] += s2*scale/ncodons
+    for i in range(nrd):
+        for j in range(stoplen):
+            stopprof[i, j] += curr[i, cdslen-stoplen+j]*scale
+    return 1
+
+
+def _get_annotated_counts_by_chrom(chrom_orfs):
     """Accumulate counts from annotated CDSs into a metagene profile. Only the longest CDS in each transcript family will be included, and only if it
     meets the minimum number-of-reads requirement. Reads are normalized by gene, so every gene included contributes equally to the final metagene."""
-    found_cds = pd.read_hdf(opts.orfstore, 'all_orfs', mode='r',
-                            where="chrom == '%s' and orftype == 'annotated' and tstop > 0 and tcoord > %d and AAlen > %d"
-                                  % (chrom_to_do, -startnt[0], min_AAlen),
-                            columns=['orfname', 'tfam', 'tid', 'tcoord', 'tstop', 'AAlen']) \
+    found_cds = chrom_orfs[(chrom_orfs['orftype'] == 'annotated') & (chrom_orfs['tcoord'] > -startnt[0]) & (chrom_orfs['AAlen'] > min_AAlen)] \
         .sort_values('AAlen', ascending=False).drop_duplicates('tfam')  # use the longest annotated CDS in each transcript family
     num_cds_incl = 0  # number of CDSs included from this chromosome
     startprof = np.zeros((len(rdlens), startlen))
     cdsprof = np.zeros((len(rdlens), 3))
     stopprof = np.zeros((len(rdlens), stoplen))
-    inbams = [pysam.Samfile(infile, 'rb') for infile in opts.bamfiles]
-    gnd = HashedReadBAMGenomeArray(inbams, ReadKeyMapFactory(Pdict, read_length_nmis))
 
     for (tid, tcoord, tstop) in found_cds[['tid', 'tcoord', 'tstop']].itertuples(False):
-        curr_trans = SegmentChain.from_bed(bedlinedict[tid])
-        tlen = curr_trans.get_length()
+        (curr_trans, curr_pos_array) = transcripts[tid]
+        tlen = len(curr_pos_array)
         if tlen >= tstop + stopnt[1]:  # need to guarantee that the 3' UTR is sufficiently long
-            curr_hashed_counts = get_hashed_counts(curr_trans, gnd)
-            cdslen = tstop+stopnt[1]-tcoord-startnt[0]  # cds length, plus the extra bases...
-            curr_counts = np.zeros((len(rdlens), cdslen))
-            for (i, rdlen) in enumerate(rdlens):
-                for nmis in range(opts.max5mis+1):
-                    curr_counts[i, :] += curr_hashed_counts[(rdlen, nmis)][tcoord+startnt[0]:tstop+stopnt[1]]
-                    # curr_counts is limited to the CDS plus any extra requested nucleotides on either side
-            if curr_counts.sum() >= opts.mincdsreads:
-                curr_counts /= curr_counts.mean()  # normalize by mean of counts across all readlengths and positions within the CDS
-                startprof += curr_counts[:, :startlen]
-                cdsprof += curr_counts[:, startlen:cdslen-stoplen].reshape((len(rdlens), -1, 3)).mean(1)
-                stopprof += curr_counts[:, cdslen-stoplen:cdslen]
-                num_cds_incl += 1
-
-    for inbam in inbams:
-        inbam.close()
+            # slice out the CDS plus any extra requested nucleotides on either side; the jitted kernel handles the rest
+            curr_counts = np.ascontiguousarray(get_hashed_counts(curr_trans, _get_gnd(), sum_over_nmis=True)[:, tcoord+startnt[0]:tstop+stopnt[1]])
+            num_cds_incl += _accumulate_cds(curr_counts, startlen, stoplen, opts.mincdsreads, startprof, cdsprof, stopprof)
 
     return startprof, cdsprof, stopprof, num_cds_incl
 
 
+@functools.lru_cache(maxsize=4096)
 def _orf_profile(orflen):
     """Generate a profile for an ORF based on the metagene profile
+    Results are cached by length, since ORFs of the same length share a profile; the returned array is marked read-only to protect the cache.
+
     Parameters
     ----------
     orflen : int
@@ -183,13 +249,15 @@ def _orf_profile(orflen):
     assert orflen > 0
     short_stop = 9
     if orflen >= startnt[1]-stopnt[0]:  # long enough to include everything
-        return np.hstack((startprof, np.tile(cdsprof, (orflen-startnt[1]+stopnt[0])/3), stopprof))
+        prof = np.hstack((startprof, np.tile(cdsprof, (orflen-startnt[1]+stopnt[0])//3), stopprof))
     elif orflen >= startnt[1]+short_stop:
-        return np.hstack((startprof, stopprof[:, startnt[1]-orflen-stopnt[1]:]))
+        prof = np.hstack((startprof, stopprof[:, startnt[1]-orflen-stopnt[1]:]))
     elif orflen >= short_stop:
-        return np.hstack((startprof[:, :orflen-short_stop-startnt[0]], stopprof[:, -short_stop-stopnt[1]:]))
+        prof = np.hstack((startprof[:, :orflen-short_stop-startnt[0]], stopprof[:, -short_stop-stopnt[1]:]))
     else:  # very short!
-        return np.hstack((startprof[:, :3-startnt[0]], stopprof[:, 3-orflen-stopnt[0]:]))
+        prof = np.hstack((startprof[:, :3-startnt[0]], stopprof[:, 3-orflen-stopnt[0]:]))
+    prof.setflags(write=False)
+    return prof
 
 
 if opts.startonly:
@@ -198,6 +266,19 @@ else:
     failure_return = (pd.DataFrame(), pd.DataFrame(), pd.DataFrame())
 
 
+def _as_categories(df):
+    """Convert whichever of the catfields columns are present to categoricals, in a single astype call; saves disk space and read/write time"""
+    return df.astype({catfield: 'category' for catfield in catfields if catfield in df.columns}, copy=False)
+
+
+def _wald_stat(v, sub):
+    """Wald statistic v.dot(inv(sub)).dot(v), via a Cholesky solve rather than an explicit inverse (sub is symmetric positive definite)"""
+    if len(v) == 1:
+        return v[0]*v[0]/sub[0, 0]
+    cho = scipy.linalg.cho_factor(sub, lower=True, overwrite_a=True, check_finite=False)
+    return v.dot(scipy.linalg.cho_solve(cho, v, check_finite=False))
+
+
 def _regress_tfam(orf_set, gnd):
     """Performs non-negative least squares regression on all of the ORFs in a transcript family, using profiles constructed via _orf_profile()
     Also calculates Wald statistics for each orf and start codon, and for each stop codon if opts.startonly is False"""
@@ -205,35 +286,40 @@ def _regress_tfam(orf_set, gnd):
     strand = orf_set['strand'].iat[0]
     chrom = orf_set['chrom'].iat[0]
     tids = orf_set['tid'].drop_duplicates().tolist()
-    all_tfam_genpos = set()
-    tid_genpos = {}
     tlens = {}
-    for (i, tid) in enumerate(tids):
-        currtrans = SegmentChain.from_bed(bedlinedict[tid])
-        curr_pos_set = currtrans.get_position_set()
-        tlens[tid] = len(curr_pos_set)
-        tid_genpos[tid] = curr_pos_set
-        all_tfam_genpos.update(curr_pos_set)
-    tfam_segs = SegmentChain(*positionlist_to_segments(chrom, strand, list(all_tfam_genpos)))
-    all_tfam_genpos = np.array(sorted(all_tfam_genpos))
+    tid_pos_arrays = []
+    for tid in tids:
+        (currtrans, curr_pos_array) = transcripts[tid]
+        tlens[tid] = len(curr_pos_array)
+        tid_pos_arrays.append(curr_pos_array)
+    offsets = np.cumsum([0]+[len(curr_pos_array) for curr_pos_array in tid_pos_arrays])
+    # one C-level sort/dedupe yields the union of positions, and the inverse indices are exactly each transcript's indices into that union
+    (all_tfam_genpos, pos_inverse) = np.unique(np.concatenate(tid_pos_arrays), return_inverse=True)
+    nnt = len(all_tfam_genpos)
+    # identify run boundaries in the sorted positions with numpy and build the segments directly, rather than having
+    # positionlist_to_segments rediscover them with a Python-level scan
+    breaks = np.flatnonzero(np.diff(all_tfam_genpos) != 1)
+    seg_starts = np.r_[all_tfam_genpos[0], all_tfam_genpos[breaks+1]]
+    seg_ends = np.r_[all_tfam_genpos[breaks], all_tfam_genpos[-1]]+1
+    tfam_segs = SegmentChain(*[GenomicSegment(chrom, start, end, strand) for (start, end) in zip(seg_starts.tolist(), seg_ends.tolist())])
     if strand == '-':
         all_tfam_genpos = all_tfam_genpos[::-1]
-    nnt = len(all_tfam_genpos)
-    tid_indices = {tid: np.flatnonzero(np.in1d(all_tfam_genpos, list(curr_tid_genpos), assume_unique=True))
-                   for (tid, curr_tid_genpos) in tid_genpos.iteritems()}
-    hashed_counts = get_hashed_counts(tfam_segs, gnd)
-    counts = np.zeros((len(rdlens), nnt), dtype=np.float64)  # even though they are integer-valued, will need to do float arithmetic
-    for (i, rdlen) in enumerate(rdlens):
-        for nmis in range(1+opts.max5mis):
-            counts[i, :] += hashed_counts[(rdlen, nmis)]
-    counts = counts.ravel()
+        pos_inverse = nnt-1-pos_inverse
+    tid_indices = {}
+    for (i, tid) in enumerate(tids):
+        curr_indices = pos_inverse[offsets[i]:offsets[i+1]].astype(np.intp)
+        curr_indices.sort()  # ascending along all_tfam_genpos, matching the ordering flatnonzero used to produce
+        tid_indices[tid] = curr_indices
+    counts = get_hashed_counts(tfam_segs, gnd, sum_over_nmis=True).ravel().astype(np.float32)
+    # even though they are integer-valued, will need to do float arithmetic; float32 matches the design matrix
 
     if opts.startcount:
         # Only include ORFS for which there is at least some minimum reads within one nucleotide of the start codon
-        offsetmat = np.tile(nnt*np.arange(len(rdlens)), 3)  # offsets for each cond, expecting three positions to check for each
-    #    try:
-        orf_set = orf_set[[(counts[(start_idxes.repeat(len(rdlens))+offsetmat)].sum() >= opts.startcount) for start_idxes in
-                           [tid_indices[tid][tcoord-1:tcoord+2] for (tid, tcoord, tstop) in orf_set[['tid', 'tcoord', 'tstop']].itertuples(False)]]]
+        start_idxes = np.stack([tid_indices[tid][tcoord-1:tcoord+2]
+                                for (tid, tcoord, tstop) in orf_set[['tid', 'tcoord', 'tstop']].itertuples(False)])
+        # each slice is guaranteed three positions because tcoord > 0 and tstop > tcoord
+        startcount_idx = (start_idxes[:, :, None]+(nnt*np.arange(len(rdlens)))[None, None, :]).reshape(len(start_idxes), -1)
+        orf_set = orf_set[counts[startcount_idx].sum(1) >= opts.startcount]
         if orf_set.empty:
             return failure_return
 
@@ -249,9 +335,12 @@ def _regress_tfam(orf_set, gnd):
         stop_set['tcoord'] = stop_set['tstop']  # should probably be -3 nt, but this is another easy flag that distinguishes from abinit
         stop_set['orfname'] = stop_set['gstop'].apply(lambda x: '%s_%d_stop' % (tfam, x))
         orf_strength_df = pd.concat((orf_strength_df, stop_set), ignore_index=True)
-    orf_profs = []
-    indices = []
-    for (tid, tcoord, tstop) in orf_strength_df[['tid', 'tcoord', 'tstop']].itertuples(False):
+    # build the CSC arrays directly: a first pass sizes each column, then data and row indices are filled in place, avoiding per-ORF list
+    # appends and the final concatenates
+    col_specs = []  # (curr_indices, startadj, stopadj) per ORF; startadj == -1 flags a histop
+    indptr = np.empty(len(orf_strength_df)+1, dtype=np.intp)
+    indptr[0] = 0
+    for (k, (tid, tcoord, tstop)) in enumerate(orf_strength_df[['tid', 'tcoord', 'tstop']].itertuples(False)):
         if tcoord != tstop:  # not a histop
             tlen = tlens[tid]
             if tcoord+startnt[0] < 0:
@@ -263,25 +352,40 @@ def _regress_tfam(orf_set, gnd):
             else:
                 stopadj = 0
             curr_indices = tid_indices[tid][tcoord+startnt[0]+startadj:tstop+stopnt[1]-stopadj]
-            orf_profs.append(_orf_profile(tstop-tcoord)[:, startadj:tstop-tcoord+stopnt[1]-startnt[0]-stopadj].ravel())
         else:  # histop
+            (startadj, stopadj) = (-1, -1)
             curr_indices = tid_indices[tid][tstop-6:tstop]
-            orf_profs.append(stopprof[:, -6:].ravel())
-        indices.append(np.concatenate([nnt*i+curr_indices for i in xrange(len(rdlens))]))
-        # need to tile the indices for each read length
-        if len(indices[-1]) != len(orf_profs[-1]):
+        col_specs.append((curr_indices, tcoord, tstop, startadj, stopadj))
+        indptr[k+1] = indptr[k]+len(curr_indices)*len(rdlens)
+    data = np.empty(indptr[-1], dtype=np.float32)
+    rowidx = np.empty(indptr[-1], dtype=np.intp)
+    row_offsets = nnt*np.arange(len(rdlens))
+    for (k, (curr_indices, tcoord, tstop, startadj, stopadj)) in enumerate(col_specs):
+        if startadj >= 0:
+            curr_prof = _orf_profile(tstop-tcoord)[:, startadj:tstop-tcoord+stopnt[1]-startnt[0]-stopadj].ravel()
+        else:  # histop
+            curr_prof = stopprof[:, -6:].ravel()
+        if indptr[k+1]-indptr[k] != len(curr_prof):
             raise AssertionError('ORF length does not match index length')
-    orf_matrix = scipy.sparse.csc_matrix((np.concatenate(orf_profs),
-                                          np.concatenate(indices),
-                                          np.cumsum([0]+[len(curr_indices) for curr_indices in indices])),
-                                         shape=(nnt*len(rdlens), len(orf_strength_df)))
-    # better to make it a sparse matrix, even though nnls requires a dense matrix, because of linear algebra to come
-    nonzero_orfs = np.flatnonzero(orf_matrix.T.dot(counts) > 0)
+        data[indptr[k]:indptr[k+1]] = curr_prof
+        rowidx[indptr[k]:indptr[k+1]] = (row_offsets[:, None]+curr_indices[None, :]).ravel()  # tile the indices for each read length
+    orf_matrix = scipy.sparse.csc_matrix((data, rowidx, indptr), shape=(nnt*len(rdlens), len(orf_strength_df)))
+    # keeping it a sparse matrix means the regression can operate entirely on the normal equations, which are only K-by-K.
+    # The normal equations themselves are accumulated in float64 (one double-precision copy of the nonzero data): they square the design's
+    # condition number, and the overlapping ORF profiles are collinear enough that bits lost to single-precision accumulation cannot be
+    # recovered by casting the products afterwards. float32 is kept for the memory-bound parts - the profile tiling, the CSC fill and counts
+    orf_matrix64 = orf_matrix.astype(np.float64)
+    Atb = orf_matrix64.T.dot(counts.astype(np.float64))
+    nonzero_orfs = np.flatnonzero(Atb > 0)
     if len(nonzero_orfs) == 0:  # no possibility of anything coming up
         return failure_return
     orf_matrix = orf_matrix[:, nonzero_orfs]
+    orf_matrix64 = orf_matrix64[:, nonzero_orfs]
     orf_strength_df = orf_strength_df.iloc[nonzero_orfs]  # don't bother fitting ORFs with zero reads throughout their entire length
-    (orf_strs, resid) = nnls(orf_matrix.toarray(), counts)
+    Atb = Atb[nonzero_orfs]
+    AtA = orf_matrix64.T.dot(orf_matrix64).toarray()
+    orf_strs = fnnls(AtA, Atb)
+    resid = np.linalg.norm(counts-orf_matrix.dot(orf_strs))
     min_str = 1e-6  # allow for machine rounding error
     usable_orfs = orf_strs > min_str
     if not usable_orfs.any():
@@ -291,7 +395,7 @@ def _regress_tfam(orf_set, gnd):
     orf_strs = orf_strs[usable_orfs]
     orf_strength_df['orf_strength'] = orf_strs
 
-    covmat = resid*resid*np.linalg.inv(orf_matrix.T.dot(orf_matrix).toarray())/(nnt*len(rdlens)-len(orf_strength_df))
+    covmat = resid*resid*np.linalg.inv(AtA[np.ix_(usable_orfs, usable_orfs)])/(nnt*len(rdlens)-len(orf_strength_df))
     # homoscedastic version (assume equal variance at all positions)
 
     # resids = counts-orf_matrix.dot(orf_strs)
@@ -317,13 +421,14 @@ def _regress_tfam(orf_set, gnd):
         gcoord_grps = orf_strength_df[elongating_orfs].groupby('gcoord')
         covmat_starts = covmat[np.ix_(elongating_orfs.values, elongating_orfs.values)]
         orf_strs_starts = orf_strs[elongating_orfs.values]
-    start_strength_df = pd.DataFrame.from_items([('tfam', tfam),
-                                                 ('chrom', orf_set['chrom'].iloc[0]),
-                                                 ('strand', orf_set['strand'].iloc[0]),
-                                                 ('codon', gcoord_grps['codon'].first()),
-                                                 ('start_strength', gcoord_grps['orf_strength'].aggregate(np.sum))])
-    start_strength_df['W_start'] = pd.Series({gcoord: orf_strs_starts[rownums].dot(np.linalg.inv(covmat_starts[np.ix_(rownums, rownums)]))
-                                              .dot(orf_strs_starts[rownums]) for (gcoord, rownums) in gcoord_grps.indices.iteritems()})
+    start_strength_df = pd.DataFrame({'tfam': tfam,
+                                      'chrom': orf_set['chrom'].iloc[0],
+                                      'strand': orf_set['strand'].iloc[0],
+                                      'codon': gcoord_grps['codon'].first(),
+                                      'start_strength': gcoord_grps['orf_strength'].aggregate(np.sum)},
+                                     columns=['tfam', 'chrom', 'strand', 'codon', 'start_strength'])
+    start_strength_df['W_start'] = pd.Series({gcoord: _wald_stat(orf_strs_starts[rownums], covmat_starts[np.ix_(rownums, rownums)])
+                                              for (gcoord, rownums) in gcoord_grps.indices.items()})
 
     if not opts.startonly:
         # count histop towards the stop codon - but still exclude abinit
@@ -331,12 +436,13 @@ def _regress_tfam(orf_set, gnd):
         gstop_grps = orf_strength_df[include_stops].groupby('gstop')
         covmat_stops = covmat[np.ix_(include_stops.values, include_stops.values)]
         orf_strs_stops = orf_strs[include_stops.values]
-        stop_strength_df = pd.DataFrame.from_items([('tfam', tfam),
-                                                    ('chrom', orf_set['chrom'].iloc[0]),
-                                                    ('strand', orf_set['strand'].iloc[0]),
-                                                    ('stop_strength', gstop_grps['orf_strength'].aggregate(np.sum))])
-        stop_strength_df['W_stop'] = pd.Series({gstop: orf_strs_stops[rownums].dot(np.linalg.inv(covmat_stops[np.ix_(rownums, rownums)]))
-                                                .dot(orf_strs_stops[rownums]) for (gstop, rownums) in gstop_grps.indices.iteritems()})
+        stop_strength_df = pd.DataFrame({'tfam': tfam,
+                                         'chrom': orf_set['chrom'].iloc[0],
+                                         'strand': orf_set['strand'].iloc[0],
+                                         'stop_strength': gstop_grps['orf_strength'].aggregate(np.sum)},
+                                        columns=['tfam', 'chrom', 'strand', 'stop_strength'])
+        stop_strength_df['W_stop'] = pd.Series({gstop: _wald_stat(orf_strs_stops[rownums], covmat_stops[np.ix_(rownums, rownums)])
+                                                for (gstop, rownums) in gstop_grps.indices.items()})
 
         # # nohistop
         # gstop_grps = orf_strength_df[elongating_orfs].groupby('gstop')
@@ -344,45 +450,37 @@ def _regress_tfam(orf_set, gnd):
         # orf_strs_stops = orf_strs[elongating_orfs.values]
         # stop_strength_df['stop_strength_nohistop'] = gstop_grps['orf_strength'].aggregate(np.sum)
         # stop_strength_df['W_stop_nohistop'] = pd.Series({gstop:orf_strs_stops[rownums].dot(np.linalg.inv(covmat_stops[np.ix_(rownums,rownums)]))
-        #                                                  .dot(orf_strs_stops[rownums]) for (gstop, rownums) in gstop_grps.indices.iteritems()})
+        #                                                  .dot(orf_strs_stops[rownums]) for (gstop, rownums) in gstop_grps.indices.items()})
 
-        return orf_strength_df, start_strength_df, stop_strength_df
+        return tuple(_as_categories(df) for df in (orf_strength_df, start_strength_df, stop_strength_df))
     else:
-        return orf_strength_df, start_strength_df
+        return tuple(_as_categories(df) for df in (orf_strength_df, start_strength_df))
 
 
-def _regress_chrom(chrom_to_do):
+def _regress_chrom(chrom_orfs):
     """Applies _regress_tfam() to all of the transcript families on a chromosome"""
-    chrom_orfs = pd.read_hdf(opts.orfstore, 'all_orfs', mode='r', where="chrom == %r and tstop > 0 and tcoord > 0" % chrom_to_do,
-                             columns=['orfname', 'tfam', 'tid', 'tcoord', 'tstop', 'AAlen', 'chrom', 'gcoord', 'gstop', 'strand',
-                                      'codon', 'orftype', 'annot_start', 'annot_stop'])
+    chrom_to_do = chrom_orfs['chrom'].iat[0]
+    chrom_orfs = chrom_orfs[chrom_orfs['tcoord'] > 0]
     # tcoord > 0 removes ORFs where the first codon is an NTG, to avoid an indexing error
     # Those ORFs would never get called anyway since they couldn't possibly have any reads at their start codon
 
     if opts.exclude:
         chrom_orfs = chrom_orfs[~chrom_orfs['tfam'].isin(opts.exclude)]
 
-    if restrictbystartfilenames:
-        restrictedstarts = pd.DataFrame()
-        for (restrictbystart, minw) in zip(restrictbystartfilenames, opts.minwstart):
-            restrictedstarts = restrictedstarts.append(
-                pd.read_hdf(restrictbystart, 'start_strengths', mode='r', where="(chrom == %r) & (W_start > minw)" % chrom_to_do,
-                            columns=['tfam', 'chrom', 'gcoord', 'strand']), ignore_index=True).drop_duplicates()
-        chrom_orfs = chrom_orfs.merge(restrictedstarts)  # inner merge acts as a filter
-
     if chrom_orfs.empty:
         if opts.verbose > 1:
             with log_lock:
                 logprint('No ORFs found on %s' % chrom_to_do)
         return failure_return
 
-    inbams = [pysam.Samfile(infile, 'rb') for infile in opts.bamfiles]
-    gnd = HashedReadBAMGenomeArray(inbams, ReadKeyMapFactory(Pdict, read_length_nmis))
-
-    res = tuple([pd.concat(res_dfs) for res_dfs in zip(*[_regress_tfam(tfam_set, gnd) for (tfam, tfam_set) in chrom_orfs.groupby('tfam')])])
-
-    for inbam in inbams:
-        inbam.close()
+    if inner_threads > 1:
+        # when there are fewer chromosomes than processes, recover the idle cores with threads; the heavy numpy/scipy calls release the GIL
+        with ThreadPoolExecutor(max_workers=inner_threads) as executor:
+            tfam_results = list(executor.map(lambda tfam_set: _regress_tfam(tfam_set, _get_gnd()),
+                                             (tfam_set for (tfam, tfam_set) in chrom_orfs.groupby('tfam'))))
+    else:
+        tfam_results = [_regress_tfam(tfam_set, _get_gnd()) for (tfam, tfam_set) in chrom_orfs.groupby('tfam')]
+    res = tuple([pd.concat(res_dfs) for res_dfs in zip(*tfam_results)])
 
     if opts.verbose > 1:
         with log_lock:
@@ -390,8 +488,12 @@ def _regress_chrom(chrom_to_do):
 
     return res
 
-with pd.HDFStore(opts.orfstore, mode='r') as orfstore:
-    chroms = orfstore.select('all_orfs/meta/chrom/meta').values  # because saved as categorical, this is the list of all chromosomes
+# read the ORF store once up front and dispatch per-chromosome slices to the workers, rather than having every worker re-query the file
+all_orfs = pd.read_parquet(opts.orfstore,
+                           columns=['orfname', 'tfam', 'tid', 'tcoord', 'tstop', 'AAlen', 'chrom', 'gcoord', 'gstop', 'strand',
+                                    'codon', 'orftype', 'annot_start', 'annot_stop'],
+                           filters=[('tstop', '>', 0)])  # ORFs without a stop codon are neither counted nor regressed
+inner_threads = max(1, opts.numproc//max(1, all_orfs['chrom'].nunique()))  # threads per worker for the tfam loop in _regress_chrom
 
 if os.path.isfile(metafilename) and not opts.force:
     if opts.verbose:
@@ -418,12 +520,13 @@ else:
 
     if stopnt[0] >= -6:
         raise ValueError('STOPRANGE must encompass at least 3 codons prior to the stop')
-    min_AAlen = (startnt[1]-stopnt[0])/3  # actually should be longer than this to ensure at least one codon in the body
+    min_AAlen = (startnt[1]-stopnt[0])//3  # actually should be longer than this to ensure at least one codon in the body
     startlen = startnt[1]-startnt[0]
     stoplen = stopnt[1]-stopnt[0]
 
-    workers = mp.Pool(opts.numproc)
-    (startprof, cdsprof, stopprof, num_cds_incl) = [sum(x) for x in zip(*workers.map(_get_annotated_counts_by_chrom, chroms))]
+    workers = mp.Pool(opts.numproc, initializer=_init_worker)
+    (startprof, cdsprof, stopprof, num_cds_incl) = \
+        [sum(x) for x in zip(*workers.map(_get_annotated_counts_by_chrom, (g for (_, g) in all_orfs.groupby('chrom'))))]
     workers.close()
 
     startprof /= num_cds_incl  # technically not necessary, but helps for consistency of units across samples
@@ -441,41 +544,45 @@ else:
                             columns=pd.Index(rdlens, name='rdlen')))) \
         .to_csv(metafilename, sep='\t')
 
+# float32 halves the bytes moved while tiling ORF profiles and filling the design matrix; the small K-by-K covariance math stays in float64
+startprof = np.ascontiguousarray(startprof, dtype=np.float32)
+cdsprof = np.ascontiguousarray(cdsprof, dtype=np.float32)
+stopprof = np.ascontiguousarray(stopprof, dtype=np.float32)
+
 catfields = ['chrom', 'strand', 'codon', 'orftype']
 
 if not opts.noregress:
     if opts.verbose:
         logprint('Calculating regression results by chromosome')
-    workers = mp.Pool(opts.numproc)
+
+    if restrictbystartfilenames:
+        restricted_dfs = []
+        for (restrictbystart, minw) in zip(restrictbystartfilenames, opts.minwstart):
+            restricted_dfs.append(pd.read_hdf(restrictbystart, 'start_strengths', mode='r', where="W_start > minw",
+                                              columns=['tfam', 'chrom', 'gcoord', 'strand']))
+        all_orfs = all_orfs.merge(pd.concat(restricted_dfs, ignore_index=True).drop_duplicates())  # inner merge acts as a filter
+
+    workers = mp.Pool(opts.numproc, initializer=_init_worker)
     if opts.startonly:
         (orf_strengths, start_strengths) = \
-            [pd.concat(res_dfs).reset_index() for res_dfs in zip(*workers.map(_regress_chrom, chroms))]
+            [pd.concat(res_dfs).reset_index() for res_dfs in zip(*workers.map(_regress_chrom, (g for (_, g) in all_orfs.groupby('chrom'))))]
         if opts.verbose:
             logprint('Saving results')
-        for catfield in catfields:
-            if catfield in start_strengths.columns:
-                start_strengths[catfield] = start_strengths[catfield].astype('category')  # saves disk space and read/write time
-            if catfield in orf_strengths.columns:
-                orf_strengths[catfield] = orf_strengths[catfield].astype('category')  # saves disk space and read/write time
+        (orf_strengths, start_strengths) = (_as_categories(orf_strengths), _as_categories(start_strengths))
         with pd.HDFStore(regressfilename, mode='w') as outstore:
-            outstore.put('orf_strengths', orf_strengths, format='t', data_columns=True)
-            outstore.put('start_strengths', start_strengths, format='t', data_columns=True)
+            outstore.put('orf_strengths', orf_strengths, format='t', data_columns=True, complib='blosc:lz4', complevel=5)
+            outstore.put('start_strengths', start_strengths, format='t', data_columns=True, complib='blosc:lz4', complevel=5)
     else:
         (orf_strengths, start_strengths, stop_strengths) = \
-            [pd.concat(res_dfs).reset_index() for res_dfs in zip(*workers.map(_regress_chrom, chroms))]
+            [pd.concat(res_dfs).reset_index() for res_dfs in zip(*workers.map(_regress_chrom, (g for (_, g) in all_orfs.groupby('chrom'))))]
         if opts.verbose:
             logprint('Saving results')
-        for catfield in catfields:
-            if catfield in start_strengths.columns:
-                start_strengths[catfield] = start_strengths[catfield].astype('category')  # saves disk space and read/write time
-            if catfield in orf_strengths.columns:
-                orf_strengths[catfield] = orf_strengths[catfield].astype('category')  # saves disk space and read/write time
-            if catfield in stop_strengths.columns:
-                stop_strengths[catfield] = stop_strengths[catfield].astype('category')  # saves disk space and read/write time
+        (orf_strengths, start_strengths, stop_strengths) = \
+            (_as_categories(orf_strengths), _as_categories(start_strengths), _as_categories(stop_strengths))
         with pd.HDFStore(regressfilename, mode='w') as outstore:
-            outstore.put('orf_strengths', orf_strengths, format='t', data_columns=True)
-            outstore.put('start_strengths', start_strengths, format='t', data_columns=True)
-            outstore.put('stop_strengths', stop_strengths, format='t', data_columns=True)
+            outstore.put('orf_strengths', orf_strengths, format='t', data_columns=True, complib='blosc:lz4', complevel=5)
+            outstore.put('start_strengths', start_strengths, format='t', data_columns=True, complib='blosc:lz4', complevel=5)
+            outstore.put('stop_strengths', stop_strengths, format='t', data_columns=True, complib='blosc:lz4', complevel=5)
     workers.close()
 
 if opts.verbose: